@@ -1,26 +1,129 @@
-import re
-import json
-
-from datasets import load_dataset
-
-# Define the regex pattern to match valid JSONL entries with "question" and "answer"
-pattern = re.compile(r'^\s*{\s*"question"\s*:\s*".+?",\s*"solution"\s*:\s*".+?"\s*}\s*$')
-
-input_file = f"data.txt"
-output_file = f"dataset.jsonl"
-with open(input_file, "r", encoding="utf-8") as infile, open(output_file, "w", encoding="utf-8") as outfile:
-    for line_idx, line in enumerate(infile):
-        if line.startswith("{"):  # Check if the line starts with '{'
-            try:
-                row = json.loads(line)
-            except Exception as e:
-                print(f"Invalid JSON at line {line_idx + 1}: {line.strip()}")
-                continue
-            # filter key "question" and "solution"
-            row = {key: row[key] for key in row if key in ["question", "solutions"]}
-            line = json.dumps(row, ensure_ascii=False) + "\n"
-            outfile.write(line)
-
-dataset = load_dataset("json", data_files=output_file)
-dataset = dataset["train"].train_test_split(test_size=204)
-dataset.push_to_hub("qgallouedec/rick-physics-grpo")
+import math
+import mmap
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+# Must be set before `huggingface_hub` is imported, as it reads the HF_* environment variables at import time
+os.environ["HF_XET_HIGH_PERFORMANCE"] = "1"
+
+from datasets import Dataset
+from huggingface_hub import CommitOperationDelete, HfApi
+
+input_file = f"rick_grpo_raw.jsonl"
+repo_id = "qgallouedec/rick-physics-grpo"
+shards_dir = "shards"
+num_cpus = os.cpu_count() or 1
+# Target number of rows per parquet file; the number of files depends on the size of each split, not on the machine
+rows_per_shard = 100_000
+
+# Minimal dataset card, so that the Hub maps the parquet shards to the train and test splits
+dataset_card = """---
+configs:
+- config_name: default
+  data_files:
+  - split: train
+    path: data/train-*
+  - split: test
+    path: data/test-*
+---
+"""
+
+
+# Split the memory-mapped input into roughly equal shards, cut at newline boundaries
+def find_shard_boundaries(mm, num_shards):
+    size = len(mm)
+    starts = [0]
+    for k in range(1, num_shards):
+        pos = mm.find(b"\n", max(k * size // num_shards, starts[-1]))
+        if pos == -1 or pos + 1 >= size:
+            break
+        if pos + 1 > starts[-1]:
+            starts.append(pos + 1)
+    ends = starts[1:] + [size]
+    return list(zip(starts, ends))
+
+
+# Parse the given shards of the input and yield the valid rows. `datasets` splits the `shards` list across processes
+# and writes the rows straight to Arrow, so no intermediate JSONL file is needed.
+def generate_rows(shards):
+    with open(input_file, "rb") as infile:
+        mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        for start, end in shards:
+            pos = start
+            while pos < end:
+                newline = mm.find(b"\n", pos, end)
+                if newline == -1:
+                    newline = end
+                line = mm[pos:newline]
+                pos = newline + 1
+                if line.startswith(b"{"):  # Check if the line starts with '{'
+                    try:
+                        row = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        print(f"Invalid JSON: {line.decode('utf-8', errors='replace').strip()}")
+                        continue
+                    # keep only rows with both "question" and "solutions"
+                    if not ("question" in row and "solutions" in row):
+                        continue
+                    yield {"question": row["question"], "solutions": row["solutions"]}
+        mm.close()
+
+
+# Write one contiguous shard of a split to parquet
+def write_parquet_shard(split, dataset, index, num_shards):
+    path = os.path.join(shards_dir, "data", f"{split}-{index:05d}-of-{num_shards:05d}.parquet")
+    dataset.shard(num_shards=num_shards, index=index, contiguous=True).to_parquet(path)
+
+
+if __name__ == "__main__":
+    if os.path.getsize(input_file) == 0:
+        raise SystemExit(f"{input_file} is empty, run generate_dataset.py first")
+
+    with open(input_file, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        boundaries = find_shard_boundaries(mm, num_cpus)
+        mm.close()
+
+    dataset = Dataset.from_generator(
+        generate_rows, gen_kwargs={"shards": boundaries}, num_proc=min(num_cpus, len(boundaries))
+    )
+    dataset = dataset.train_test_split(test_size=204)
+
+    # Write the splits as parquet shards in parallel, then upload the folder with concurrent requests
+    # Drop shards left over from a previous run, but keep `upload_large_folder`'s resume state in `shards_dir/.cache`
+    shutil.rmtree(os.path.join(shards_dir, "data"), ignore_errors=True)
+    os.makedirs(os.path.join(shards_dir, "data"))
+    with open(os.path.join(shards_dir, "README.md"), "w", encoding="utf-8") as f:
+        f.write(dataset_card)
+    with ThreadPoolExecutor(max_workers=num_cpus) as executor:
+        futures = []
+        for split, split_dataset in dataset.items():
+            num_shards = max(1, math.ceil(len(split_dataset) / rows_per_shard))
+            for index in range(num_shards):
+                futures.append(executor.submit(write_parquet_shard, split, split_dataset, index, num_shards))
+        for future in futures:
+            future.result()
+
+    api = HfApi()
+    api.create_repo(repo_id, repo_type="dataset", exist_ok=True)
+    api.upload_large_folder(repo_id=repo_id, repo_type="dataset", folder_path=shards_dir)
+
+    # upload_large_folder only adds files, so remove the remote shards that are not part of this upload, otherwise the
+    # `data/*` globs of the card would also pick them up. This is done after the upload so that the dataset is never
+    # left without data files.
+    local_files = {f"data/{name}" for name in os.listdir(os.path.join(shards_dir, "data"))}
+    stale_files = [
+        path
+        for path in api.list_repo_files(repo_id, repo_type="dataset")
+        if path.startswith("data/") and path not in local_files
+    ]
+    if stale_files:
+        api.create_commit(
+            repo_id=repo_id,
+            repo_type="dataset",
+            operations=[CommitOperationDelete(path_in_repo=path) for path in stale_files],
+            commit_message="Remove previous data files",
+        )
@@ -1,111 +1,12 @@
-from openai import OpenAI
-
-client = OpenAI()
-
-themes = [
-    "Speed = distance / time",
-    "Acceleration = change in velocity / time",
-    "Newton's First Law of Motion",
-    "Newton's Second Law (F = ma)",
-    "Newton's Third Law of Motion",
-    "Weight = mass × gravitational field strength",
-    "Mass vs. weight",
-    "Kinetic energy = 0.5 × mass × velocity^2",
-    "Potential energy = mass × gravity × height",
-    "Conservation of energy",
-    "Power = work / time",
-    "Work = force × distance",
-    "Gravitational potential energy",
-    "Hooke’s Law (F = kx)",
-    "Elastic potential energy",
-    "Friction force",
-    "Normal force",
-    "Air resistance",
-    "Terminal velocity",
-    "Momentum = mass × velocity",
-    "Conservation of momentum",
-    "Impulse = force × time",
-    "Free fall motion",
-    "Projectile motion",
-    "Distance-time graph interpretation",
-    "Velocity-time graph interpretation",
-    "Area under velocity-time graph = displacement",
-    "Slope of distance-time graph = speed",
-    "Slope of velocity-time graph = acceleration",
-    "Thermal expansion of solids",
-    "Conduction of heat",
-    "Convection of heat",
-    "Radiation of heat",
-    "Specific heat capacity",
-    "Latent heat of fusion",
-    "Latent heat of vaporization",
-    "States of matter and particle theory",
-    "Pressure = force / area",
-    "Atmospheric pressure",
-    "Pressure in liquids = density × gravity × height",
-    "Buoyant force (Archimedes' principle)",
-    "Pascal’s Principle",
-    "Bernoulli’s Principle (basic idea)",
-    "Simple harmonic motion (spring or pendulum basics)",
-    "Wave speed = frequency × wavelength",
-    "Reflection of light",
-    "Refraction of light",
-    "Snell's Law (qualitative)",
-    "Dispersion of light",
-    "Laws of reflection",
-    "Total internal reflection",
-    "Plane mirror image characteristics",
-    "Concave mirror ray diagrams",
-    "Convex mirror ray diagrams",
-    "Lenses (concave and convex, basic behavior)",
-    "Light travels in straight lines",
-    "Color and visible spectrum",
-    "Sound travels as longitudinal wave",
-    "Speed of sound in air",
-    "Echo and reflection of sound",
-    "Frequency and pitch of sound",
-    "Amplitude and loudness of sound",
-    "Electrostatics: charges attract/repel",
-    "Charging by friction",
-    "Conductors vs. insulators",
-    "Electric current = charge / time",
-    "Voltage = energy / charge",
-    "Ohm’s Law (V = IR)",
-    "Resistance = voltage / current",
-    "Series circuit: total resistance",
-    "Parallel circuit: current splitting",
-    "Series circuit: voltage division",
-    "Electric power = voltage × current",
-    "Electric energy = power × time",
-    "Magnetic fields around magnets",
-    "Magnetic field around current-carrying wire",
-    "Right-hand rule for current and magnetic field",
-    "Electromagnets",
-    "Factors affecting strength of electromagnet",
-    "Simple electric motor (basic principle)",
-    "Electromagnetic induction (basic concept)",
-    "Static electricity and sparks",
-    "Earth’s magnetic field",
-    "Compass and magnetic poles",
-    "Gravitational field strength on Earth",
-    "Mass of Earth (known constant)",
-    "Density = mass / volume",
-    "Units of force (newton)",
-    "Units of pressure (pascal)",
-    "Units of energy (joule)",
-    "Units of power (watt)",
-    "Conversion between energy units (kWh to J)",
-    "Speed of light in vacuum",
-    "Law of conservation of mass",
-    "Simple lever principle",
-    "Moment = force × perpendicular distance",
-    "Equilibrium of moments",
-    "Center of mass",
-    "Stability and base of support",
-    "Pulleys (mechanical advantage basics)",
-    "Inclined plane mechanics",
-    "Simple machines: efficiency = useful energy out / total energy in"
-]
+import argparse
+import asyncio
+import os
+
+import orjson
+from openai import AsyncOpenAI
+
+client = AsyncOpenAI()
+
 
 prompt_template = """You are a physics tutor tasked with generating high-quality, diverse numerical word problems for fine-tuning a model.
 
@@ -129,6 +30,81 @@ Your task:
    ```
 """
 
-for theme in themes:
-    response = client.responses.create(model="gpt-4o", input=prompt_template.format(theme=theme))
-    print(response.output_text)
+# Render the template once with a placeholder and keep the text around it, so each prompt is a plain concatenation
+prompt_prefix, prompt_suffix = prompt_template.format(theme="\0").split("\0")
+
+
+def build_prompt(theme):
+    return f"{prompt_prefix}{theme}{prompt_suffix}"
+
+
+output_file = "rick_grpo_raw.jsonl"
+done_file = "done.txt"
+
+
+# Function to clean LLM output
+def clean_output(raw_output):
+    cleaned = raw_output.strip()
+    if cleaned[:7].lower() == "```json":
+        cleaned = cleaned[7:]
+    elif cleaned.startswith("```"):
+        cleaned = cleaned[3:]
+    if cleaned.endswith("```"):
+        cleaned = cleaned[:-3]
+    return cleaned.strip()
+
+
+# Async LLM call per theme, bounded by the semaphore. Results are written as soon as they arrive, and the theme is
+# recorded in `done_file` so that a re-run skips it. A failing theme is logged and left for the next run, without
+# interrupting the others.
+async def run_theme(theme, sem, outfile, donefile):
+    try:
+        async with sem:
+            response = await client.responses.create(model="gpt-4o", input=build_prompt(theme))
+    except Exception as e:
+        print(f"Error processing theme: {theme}\n{e}")
+        return
+    outfile.write(clean_output(response.output_text) + "\n")
+    outfile.flush()
+    os.fsync(outfile.fileno())
+    donefile.write(theme + "\n")
+    donefile.flush()
+    os.fsync(donefile.fileno())
+
+
+async def main(themes):
+    done = set()
+    if os.path.exists(done_file):
+        with open(done_file, "r", encoding="utf-8") as f:
+            done = set(f.read().splitlines())
+    todo = [theme for theme in themes if theme not in done]
+    print(f"{len(themes) - len(todo)} themes already done, {len(todo)} remaining.")
+
+    sem = asyncio.Semaphore(32)
+    with open(output_file, "a", encoding="utf-8") as outfile, open(done_file, "a", encoding="utf-8") as donefile:
+        await asyncio.gather(*(run_theme(theme, sem, outfile, donefile) for theme in todo))
+
+
+# Parse `--shard i/N` into `(i, N)`, with 0 <= i < N
+def parse_shard(value):
+    try:
+        shard_idx, num_shards = map(int, value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected `i/N`, got {value!r}")
+    if not 0 <= shard_idx < num_shards:
+        raise argparse.ArgumentTypeError(f"expected 0 <= i < N, got {value!r}")
+    return shard_idx, num_shards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--shard", type=parse_shard, default=(0, 1), help="Only process shard `i/N` of the themes, to split the work"
+    )
+    args = parser.parse_args()
+    shard_idx, num_shards = args.shard
+
+    with open("themes.json", "rb") as f:
+        themes = orjson.loads(f.read())
+
+    asyncio.run(main(themes[shard_idx::num_shards]))
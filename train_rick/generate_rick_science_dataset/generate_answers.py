@@ -1,10 +1,28 @@
 import asyncio
-import json
-import re
+import os
+import aiofiles
 from tqdm.asyncio import tqdm
+import httpx
 import openai
+import orjson
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
-client = openai.AsyncOpenAI()
+# Shared connection pool, sized for the number of concurrent requests, so connections are reused across requests
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=128, max_keepalive_connections=64), http2=True, timeout=60.0
+)
+# Built-in retries are disabled, retries are handled by `create_response` below
+client = openai.AsyncOpenAI(http_client=http_client, max_retries=0)
+
+# Number of worker coroutines, i.e. cap on the number of in-flight requests, and depth of the question/result queues
+num_workers = 64
+queue_size = 256
+# Number of answers written between two flushes of the cache file
+flush_every = 32
+
+# Answers from every run, keyed by question, so that questions already answered are never sent again
+cache_file = "answers_cache.jsonl"
+dataset_file = "dataset.jsonl"
 
 
 template = """
@@ -33,46 +51,181 @@ Output:
 }}
 """
 
-
-# Function to clean LLM output
-def clean_output(raw_output):
-    return re.sub(r"^```(?:json)?|```$", "", raw_output.strip(), flags=re.IGNORECASE).strip()
-
-# Async LLM call per question
+# Render the template once with a placeholder and keep the text around it, so each prompt is a plain concatenation
+template_prefix, template_suffix = template.format(question="\0").split("\0")
+
+
+def build_prompt(question):
+    return f"{template_prefix}{question}{template_suffix}"
+
+
+# LLM call, retried with jittered exponential backoff on transient errors (rate limits, connection issues including
+# timeouts, 5xx)
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=1, max=30),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)),
+    reraise=True,
+)
+async def create_response(question):
+    # JSON mode guarantees a bare JSON object, without code fences
+    return await client.responses.create(
+        model="gpt-4o", input=build_prompt(question), text={"format": {"type": "json_object"}}
+    )
+
+# `questions.txt` holds the JSON arrays printed by generate_questions.py, so a line looks like `"How does X?",`.
+# Strip the trailing comma and unquote the string, so that cache keys match the question echoed by the model in its
+# answer. The array brackets are not questions and normalize to an empty string.
+def normalize_question(line):
+    question = line.strip().removesuffix(",").strip()
+    if question in ("[", "]"):
+        return ""
+    if len(question) >= 2 and question.startswith('"') and question.endswith('"'):
+        try:
+            return orjson.loads(question)
+        except orjson.JSONDecodeError:
+            return question[1:-1].strip()
+    return question
+
+# Async LLM call per question, returns the question with its parsed answer (None on failure)
 async def process_question(session, question):
     question = question.strip()
     if not question:
-        return None
+        return question, None
 
     try:
-        response = await client.responses.create(model="gpt-4o", input=template.format(question=question))
+        response = await create_response(question)
         raw_output = response.output[0].content[0].text
-        cleaned = clean_output(raw_output)
-        parsed = json.loads(cleaned)
-        return json.dumps(parsed, ensure_ascii=False)
+        return question, orjson.loads(raw_output)
+
+    except orjson.JSONDecodeError as e:
+        print(f"Invalid JSON for question: {question}\n{e}")
+        return question, None
 
     except Exception as e:
         print(f"Error processing question: {question}\n{e}")
-        return None
+        return question, None
+
+# Load the cached answers. A run killed mid-write can leave a truncated last line, which is logged and cut off, or a
+# complete last entry without its newline, which gets one. Either way, the next appends start on a fresh line.
+def load_cache():
+    cache = {}
+    if os.path.exists(cache_file):
+        valid_size = 0
+        missing_newline = False
+        with open(cache_file, "rb") as f:
+            for line_idx, line in enumerate(f):
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    print(f"Invalid cache entry at line {line_idx + 1} of {cache_file}, dropping it")
+                    if not line.endswith(b"\n"):  # partial last line
+                        break
+                else:
+                    cache[normalize_question(entry["question"])] = entry["answer"]
+                    missing_newline = not line.endswith(b"\n")
+                valid_size += len(line)
+        if valid_size < os.path.getsize(cache_file):
+            os.truncate(cache_file, valid_size)
+        elif missing_newline:
+            with open(cache_file, "ab") as f:
+                f.write(b"\n")
+    return cache
+
+# Older versions of this script appended answers to `dataset_file` without a cache. On the first run with a cache,
+# seed it from those answers so that they are not paid for again. `dataset_file` is now rebuilt from the cache, so it
+# is first moved to a backup, and the cache is written to a temporary file and moved into place once complete: an
+# interrupted seed is simply redone from the backup on the next run.
+def seed_cache_from_dataset():
+    backup_file = dataset_file + ".bak"
+    if os.path.exists(cache_file):
+        return
+    if os.path.exists(dataset_file):
+        if os.path.exists(backup_file):
+            raise SystemExit(f"{dataset_file} and {backup_file} both exist without {cache_file}, refusing to overwrite")
+        os.replace(dataset_file, backup_file)
+    if not os.path.exists(backup_file):
+        return
+    tmp_file = cache_file + ".tmp"
+    with open(backup_file, "rb") as fin, open(tmp_file, "wb") as fout:
+        for line in fin:
+            try:
+                answer = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(answer, dict) and isinstance(answer.get("question"), str):
+                question = normalize_question(answer["question"])
+                fout.write(orjson.dumps({"question": question, "answer": answer}) + b"\n")
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_file, cache_file)
+    print(f"Seeded {cache_file} from {backup_file}")
+
+# Stream unique, not yet cached questions from the file into the queue, then one stop signal per worker. The progress
+# bar total grows as questions are queued, so it tracks the number of questions left to answer.
+async def producer(questions, cache, pbar):
+    seen = set()
+    with open("questions.txt", "r") as f:
+        for line in f:
+            question = normalize_question(line)
+            if not question or question in cache or question in seen:
+                continue
+            seen.add(question)
+            pbar.total += 1
+            pbar.refresh()
+            await questions.put(question)
+    for _ in range(num_workers):
+        await questions.put(None)
+
+async def worker(questions, results):
+    while (question := await questions.get()) is not None:
+        await results.put(await process_question(None, question))
+    await results.put(None)
+
+# Cache each answer as soon as it arrives, until every worker is done. The file is written asynchronously so that the
+# event loop is never blocked on disk I/O.
+async def writer(results, cache, pbar):
+    num_done = 0
+    num_written = 0
+    async with aiofiles.open(cache_file, "ab") as f:
+        while num_done < num_workers:
+            result = await results.get()
+            if result is None:
+                num_done += 1
+                continue
+            question, answer = result
+            pbar.update()
+            if answer is not None:
+                cache[question] = answer
+                await f.write(orjson.dumps({"question": question, "answer": answer}) + b"\n")
+                num_written += 1
+                if num_written % flush_every == 0:
+                    await f.flush()
 
 # Main runner
 async def main():
-    with open("questions.txt", "r") as f:
-        questions = [line.strip() for line in f if line.strip()]
-
-    batch_size = 32
-    for idx in range(0, len(questions), batch_size):
-        batch = questions[idx:idx + batch_size]
-        print(f"Processing batch {idx // batch_size + 1} of {len(questions) // batch_size + 1}...")
+    seed_cache_from_dataset()
+    cache = load_cache()
+    print(f"{len(cache)} questions already answered.")
 
-        # Process each question in the batch
-        tasks = [process_question(None, q) for q in batch]
-        results = await tqdm.gather(*tasks)
-
-        with open("dataset.jsonl", "a", encoding="utf-8") as f:
-            for r in results:
-                if r:
-                    f.write(r + "\n")
+    questions = asyncio.Queue(maxsize=queue_size)
+    results = asyncio.Queue(maxsize=queue_size)
+    try:
+        with tqdm(desc="Answering questions", total=0) as pbar:
+            await asyncio.gather(
+                producer(questions, cache, pbar),
+                *(worker(questions, results) for _ in range(num_workers)),
+                writer(results, cache, pbar),
+            )
+    finally:
+        await http_client.aclose()
+
+    # Write the dataset in the original question order, replaying cached answers for duplicates
+    with open("questions.txt", "r") as fin, open(dataset_file, "wb") as fout:
+        for line in fin:
+            question = normalize_question(line)
+            if question in cache:
+                fout.write(orjson.dumps(cache[question]) + b"\n")
 
 # Run the event loop
 asyncio.run(main())